@@ -1,10 +1,410 @@
-import gradio as gr
-import requests
 import os
-from transformers import AutoTokenizer, AutoModelForCausalLM
+
+# Use OMP_NUM_THREADS for CPU inference when set, otherwise half the cores;
+# decided before numpy/torch start their thread pools
+try:
+    _CPU_THREADS = max(1, int(os.environ["OMP_NUM_THREADS"]))
+except (KeyError, ValueError):
+    _CPU_THREADS = max(1, (os.cpu_count() or 2) // 2)
+    os.environ["OMP_NUM_THREADS"] = str(_CPU_THREADS)
+
+import gradio as gr
+import httpx
+import orjson
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
 from datetime import datetime
 import random
+import re
 import pytz
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import chain
+from types import MappingProxyType
+from urllib.parse import quote_plus
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the helpers below also run as plain Python
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
+if not torch.cuda.is_available():
+    torch.set_num_threads(_CPU_THREADS)
+    torch.set_num_interop_threads(1)
+
+# Every chat prompt starts with this prefix, so it is tokenized only once
+_PROMPT_PREFIX = "As a space expert, explain:"
+_MAX_PROMPT_TOKENS = 512
+
+# Chat prompts arriving within this window are generated together as one batch
+_BATCH_WINDOW = 0.03
+_MAX_BATCH = 8
+
+# With torch.compile, batches are padded up to one of these sizes so compiled graphs are reused
+_COMPILED_BATCH_SIZES = (1, 2, 4, _MAX_BATCH)
+
+# Prompts are only batched with others of similar length, as (max prompt tokens, max new tokens)
+_LENGTH_BINS = ((32, 96), (96, 160), (256, 200), (_MAX_PROMPT_TOKENS, 200))
+
+# Generation settings for open-ended answers and for the deterministic greedy fast-path
+_SAMPLING_KWARGS = {"do_sample": True, "temperature": 0.8, "top_p": 0.95, "repetition_penalty": 1.2}
+_GREEDY_KWARGS = {"do_sample": False, "num_beams": 1, "repetition_penalty": 1.2}
+
+
+# How long NASA responses are served before being refreshed, in seconds
+_APOD_TTL = 24 * 60 * 60
+_SEARCH_TTL = 60 * 60
+_WEATHER_TTL = 60
+
+# Concurrent NASA tab events; these are async and mostly served from cache
+_NASA_CONCURRENCY = 32
+_QUEUE_MAX_SIZE = 64
+
+# Number of greedy chat answers kept for identical questions
+_ANSWER_CACHE_SIZE = 1024
+
+
+# Fun facts appended to every chat answer
+_FUN_FACTS = (
+    "A day on Venus is longer than its year! 😮",
+    "The footprints on the Moon will stay there for millions of years! 👣",
+    "Saturn could float in a giant bathtub because it's less dense than water! 🛁"
+)
+
+# Read-only scenarios used when live NASA space weather is unavailable
+_WEATHER_SCENARIOS = (
+    MappingProxyType({
+        "status": "🌟 Perfect Space Weather",
+        "conditions": (
+            MappingProxyType({"label": "Current Activity", "value": "Calm", "emoji": "✨"}),
+            MappingProxyType({"label": "Solar Activity", "value": "Low", "emoji": "🌞"}),
+            MappingProxyType({"label": "Aurora Forecast", "value": "Not Visible", "emoji": "🌙"})
+        ),
+        "description": "Perfect conditions for stargazing tonight! The Milky Way should be clearly visible.",
+    }),
+    MappingProxyType({
+        "status": "🌠 Aurora Alert",
+        "conditions": (
+            MappingProxyType({"label": "Current Activity", "value": "Active", "emoji": "⚡"}),
+            MappingProxyType({"label": "Solar Activity", "value": "High", "emoji": "🌞"}),
+            MappingProxyType({"label": "Aurora Forecast", "value": "Visible", "emoji": "🎆"})
+        ),
+        "description": "A solar storm is creating perfect conditions for aurora viewing! Look toward the northern horizon tonight.",
+    }),
+    MappingProxyType({
+        "status": "☄️ Meteor Shower",
+        "conditions": (
+            MappingProxyType({"label": "Current Activity", "value": "Special Event", "emoji": "☄️"}),
+            MappingProxyType({"label": "Solar Activity", "value": "Normal", "emoji": "🌞"}),
+            MappingProxyType({"label": "Aurora Forecast", "value": "Not Visible", "emoji": "🌙"})
+        ),
+        "description": "A meteor shower is expected tonight! Best viewing hours are between 11 PM and 3 AM.",
+    })
+)
+
+
+# Emoji for each DONKI message type, and keywords looked up in the message body
+_WEATHER_EMOJI = MappingProxyType({
+    "Report": "🛸",
+    "Watch": "⚠️",
+    "Warning": "🚨",
+    "Alert": "⚡"
+})
+_FLARE_RE = re.compile(r"flare", re.IGNORECASE)
+_AURORA_RE = re.compile(r"aurora", re.IGNORECASE)
+
+
+def _weather_time():
+    """Time shown as 'Last updated' on the space weather tab"""
+    return datetime.now().strftime("%I:%M %p")
+
+
+class NasaAPIError(Exception):
+    """Raised when a NASA endpoint answers with a non-200 status"""
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries go stale after a time-to-live"""
+
+    def __init__(self, ttl, maxsize=128):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (value, is_fresh), or None if the key was never cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            stored_at, value = entry
+            return value, time.monotonic() - stored_at < self.ttl
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def claim_refresh(self, key):
+        """Return True for the single caller that should refresh a stale key"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def release_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+
+@njit(cache=True)
+def build_left_padded_batch(flat_ids, lengths, max_len, pad_id):
+    """Left-pad concatenated prompts into (batch, max_len) input ids and attention mask"""
+    # Batched decoding needs prompts right-aligned so generation continues from real tokens
+    batch = lengths.shape[0]
+    input_ids = np.full((batch, max_len), pad_id, dtype=np.int64)
+    attention_mask = np.zeros((batch, max_len), dtype=np.int64)
+    offset = 0
+    for row in range(batch):
+        length = lengths[row]
+        start = max_len - length
+        for col in range(length):
+            input_ids[row, start + col] = flat_ids[offset + col]
+            attention_mask[row, start + col] = 1
+        offset += length
+    return input_ids, attention_mask
+
+
+def fun_fact_footers(count):
+    """Fun fact endings for a batch of responses, drawn with a single RNG call"""
+    return [f"\n\n✨ Fun Fact: {fun_fact}" for fun_fact in random.choices(_FUN_FACTS, k=count)]
+
+
+class ChatStream:
+    """Text chunks of one chat response, readable by any number of consumers as they arrive"""
+
+    def __init__(self):
+        self._chunks = []
+        self._answer_len = 0
+        self._done = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def put(self, text):
+        with self._cond:
+            self._chunks.append(text)
+            self._cond.notify_all()
+
+    def update(self, answer):
+        """Publish whatever the answer generated so far adds to what was already sent"""
+        # Whitespace at either end is held back until real text follows it
+        answer = answer.strip()
+        if len(answer) > self._answer_len:
+            self.put(answer[self._answer_len:])
+            self._answer_len = len(answer)
+
+    @property
+    def failed(self):
+        with self._cond:
+            return self._done and self._error is not None
+
+    def finish(self, error=None):
+        with self._cond:
+            if not self._done:
+                self._done = True
+                self._error = error
+                self._cond.notify_all()
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self._cond:
+                while index == len(self._chunks) and not self._done:
+                    self._cond.wait()
+                chunks = self._chunks[index:]
+                done, error = self._done, self._error
+            index += len(chunks)
+            yield from chunks
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class BatchStreamer(BaseStreamer):
+    """Fan the tokens of one batched generate call out to each prompt's ChatStream"""
+
+    def __init__(self, tokenizer, streams):
+        self.tokenizer = tokenizer
+        self.streams = streams
+        self._stop_ids = {tokenizer.eos_token_id, tokenizer.pad_token_id}
+        self._tokens = [[] for _ in streams]
+        self._footers = fun_fact_footers(len(streams))
+        self._stopped = [False] * len(streams)
+        self._prompt_seen = False
+        self.started = False
+
+    def put(self, value):
+        # generate first hands over the prompt ids, then one new token per row each step
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        self.started = True
+        for row, token in enumerate(value.reshape(len(self.streams), -1)[:, -1].tolist()):
+            if self._stopped[row]:
+                continue
+            if token in self._stop_ids:
+                # Close this row now instead of waiting for the longest answer in the batch
+                self._finish_row(row)
+                continue
+            self._tokens[row].append(token)
+            text = self.tokenizer.decode(self._tokens[row], skip_special_tokens=True)
+            # Hold back partial multi-byte characters until the next token completes them
+            if not text.endswith("\ufffd"):
+                self.streams[row].update(text)
+
+    def end(self):
+        for row in range(len(self.streams)):
+            if not self._stopped[row]:
+                self._finish_row(row)
+
+    def _finish_row(self, row):
+        self._stopped[row] = True
+        self.streams[row].put(self._footers[row])
+        self.streams[row].finish()
+
+
+def _attention_implementation():
+    """Use FlashAttention-2 on Ampere or newer GPUs when installed, otherwise fused SDPA"""
+    if torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 8:
+        try:
+            import flash_attn  # noqa: F401
+            return "flash_attention_2"
+        except ImportError:
+            pass
+    return "sdpa"
+
+
+def _model_load_kwargs():
+    """Pick reduced-precision weights and a fused attention kernel so each step moves fewer bytes"""
+    kwargs = {"attn_implementation": _attention_implementation()}
+    if not torch.cuda.is_available():
+        return kwargs
+    dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    kwargs.update(torch_dtype=dtype, device_map="auto")
+    try:
+        import bitsandbytes  # noqa: F401
+        from transformers import BitsAndBytesConfig
+    except ImportError:
+        return kwargs
+    kwargs["quantization_config"] = BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_quant_type="nf4",
+        bnb_4bit_compute_dtype=dtype
+    )
+    return kwargs
+
+
+def _model_load_attempts():
+    """Load settings to try in order, from the most optimized down to transformers' defaults"""
+    kwargs = _model_load_kwargs()
+    attempts = [kwargs]
+    if "quantization_config" in kwargs:
+        # bitsandbytes can import yet fail to load NF4 weights, e.g. with a mismatched CUDA build;
+        # half-precision weights on the GPU are still far better than an fp32 CPU model
+        attempts.append({key: value for key, value in kwargs.items() if key != "quantization_config"})
+    if kwargs.get("attn_implementation") == "flash_attention_2":
+        # flash_attn can import yet fail to load (wrong CUDA build), so try each setting
+        # again with SDPA before dropping its dtype and device_map
+        attempts = [
+            variant
+            for attempt in attempts
+            for variant in (attempt, dict(attempt, attn_implementation="sdpa"))
+        ]
+    if kwargs:
+        attempts.append({})
+    return attempts
+
+
+class StopAfterSteps(StoppingCriteria):
+    """Stop generation after a fixed number of steps, regardless of max_new_tokens"""
+
+    def __init__(self, steps):
+        self.steps = steps
+        self._calls = 0
+
+    def __call__(self, input_ids, scores, **kwargs):
+        self._calls += 1
+        done = self._calls >= self.steps
+        return torch.full((input_ids.shape[0],), done, dtype=torch.bool, device=input_ids.device)
+
+
+class ChatBatcher:
+    """Coalesce concurrent chat prompts of similar length into batched generate calls"""
+
+    def __init__(self, generate_fn, bins=_LENGTH_BINS, max_batch=_MAX_BATCH, window=_BATCH_WINDOW):
+        self.generate_fn = generate_fn
+        self.bins = bins
+        self.max_batch = max_batch
+        self.window = window
+        # Pending prompts keyed by (length bin, greedy) since a batch shares its sampling mode
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, input_ids, greedy=False):
+        """Queue a tokenized prompt and return the ChatStream its response is written to"""
+        stream = ChatStream()
+        key = (self._bin_for(len(input_ids)), greedy)
+        with self._cond:
+            self._pending.setdefault(key, deque()).append((time.monotonic(), input_ids, stream))
+            self._cond.notify()
+        return stream
+
+    def _bin_for(self, length):
+        for index, (max_len, _) in enumerate(self.bins):
+            if length <= max_len:
+                return index
+        return len(self.bins) - 1
+
+    def _next_batch(self):
+        """Wait until a bin is full or its oldest prompt has waited a whole window"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                timeout = None
+                for key, pending in self._pending.items():
+                    if not pending:
+                        continue
+                    wait = pending[0][0] + self.window - now
+                    if len(pending) >= self.max_batch or wait <= 0:
+                        size = min(self.max_batch, len(pending))
+                        return key, [pending.popleft() for _ in range(size)]
+                    timeout = wait if timeout is None else min(timeout, wait)
+                self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            (bin_index, greedy), batch = self._next_batch()
+            max_len, max_new_tokens = self.bins[bin_index]
+            streams = [stream for _, _, stream in batch]
+            try:
+                self.generate_fn([ids for _, ids, _ in batch], max_len, max_new_tokens, greedy, streams)
+            except Exception as e:
+                for stream in streams:
+                    stream.finish(e)
 
 
 class SpaceImageExplorer:
@@ -16,184 +416,358 @@ class SpaceImageExplorer:
         # Initialize NASA API key
         self.nasa_api_key = os.getenv('NASA_API_KEY', 'DEMO_KEY')
 
-        # Initialize Gemma model and tokenizer
+        # Share one pooled HTTP/2 client for NASA calls and cache responses that change slowly
+        self.http = httpx.AsyncClient(
+            http2=True,
+            timeout=5,
+            limits=httpx.Limits(max_connections=64),
+            headers={"Accept-Encoding": "gzip"}
+        )
+        self._refresh_tasks = set()
+        self.apod_cache = TTLCache(ttl=_APOD_TTL, maxsize=1)
+        self.search_cache = TTLCache(ttl=_SEARCH_TTL, maxsize=512)
+        self.weather_cache = TTLCache(ttl=_WEATHER_TTL, maxsize=1)
+
+        # Greedy answers are deterministic, so identical questions share one generation
+        self.answer_cache = TTLCache(ttl=float("inf"), maxsize=_ANSWER_CACHE_SIZE)
+        self._answer_lock = threading.Lock()
+
+        # Use a vLLM (or other OpenAI-compatible) server when configured; it batches requests itself
+        self.vllm_base_url = os.getenv('VLLM_BASE_URL')
+        self.llm_client = None
+        if self.vllm_base_url:
+            from openai import OpenAI
+            self.llm_client = OpenAI(base_url=self.vllm_base_url, api_key=os.getenv('VLLM_API_KEY', 'EMPTY'))
+            self.llm_model = os.getenv('VLLM_MODEL', 'google/gemma-2b')
+            print(f"Using Gemma served at {self.vllm_base_url}")
+
+        # Gemma is loaded in-process on the first chat request, see _ensure_model
+        self._model = None
+        self._tokenizer = None
+        self.chat_batcher = None
+        self._eager_forward = None
+        self._model_lock = threading.Lock()
+
+    def _ensure_model(self):
+        """Load Gemma on first chat use so the image and weather tabs start instantly"""
+        with self._model_lock:
+            if self._model is None:
+                self._load_local_model()
+
+    def preload_model(self):
+        """Opt-in: load Gemma on a background thread so the first chat doesn't wait for it"""
+        # Off by default so chat-free sessions never hold the model in memory
+        if self.llm_client is not None or os.getenv('PRELOAD_MODEL', '0') != '1':
+            return
+        threading.Thread(target=self._preload, daemon=True).start()
+
+    def _preload(self):
+        try:
+            self._ensure_model()
+        except Exception:
+            pass  # already reported by _load_local_model; the first chat retries the load
+
+    def _load_local_model(self):
+        """Initialize Gemma model and tokenizer in-process, with a batcher in front of generate"""
         try:
             print("Loading Gemma 2B model...")
             model_name = "google/gemma-2b"
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.model = AutoModelForCausalLM.from_pretrained(model_name)
+            self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+            if self._tokenizer.pad_token is None:
+                self._tokenizer.pad_token = self._tokenizer.eos_token
+            bos_ids = [self._tokenizer.bos_token_id] if self._tokenizer.bos_token_id is not None else []
+            self._prefix_ids = bos_ids + self._tokenizer(_PROMPT_PREFIX, add_special_tokens=False)["input_ids"]
+
+            attempts = _model_load_attempts()
+            for attempt, load_kwargs in enumerate(attempts, start=1):
+                try:
+                    model = AutoModelForCausalLM.from_pretrained(model_name, **load_kwargs)
+                    break
+                except Exception as e:
+                    if attempt == len(attempts):
+                        raise
+                    print(f"Model load attempt {attempt} failed ({str(e)}), retrying with fewer optimizations")
+            self.chat_batcher = ChatBatcher(self._generate_batch)
+            self._model = model
+            # Compile by default only when the model actually landed on CUDA (a fallback load
+            # may have put it on CPU), where CUDA graphs pay back the compile time
+            on_cuda = self._model.device.type == "cuda"
+            if os.getenv('TORCH_COMPILE', '1' if on_cuda else '0') != '0':
+                self._compile_model()
             print("Model loaded successfully!")
         except Exception as e:
             print(f"Error loading model: {str(e)}")
             raise
 
-        # Space knowledge base with fun facts
-        self.space_knowledge = {
-            "fun_facts": [
-                "A day on Venus is longer than its year! 😮",
-                "The footprints on the Moon will stay there for millions of years! 👣",
-                "Saturn could float in a giant bathtub because it's less dense than water! 🛁"
-            ]
-        }
+    def _compile_model(self):
+        """Compile the forward pass and warm up every shape so chats never compile on demand"""
+        if not hasattr(torch, "compile"):  # torch < 2.0
+            return
+        self._eager_forward = self._model.forward
+        try:
+            # A static KV cache keeps decode shapes fixed; with the length bins and padded
+            # batch sizes, each (bin, batch size) pair is one set of graphs
+            self._model.generation_config.cache_implementation = "static"
+            self._model.forward = torch.compile(self._eager_forward, mode="reduce-overhead")
+            bos = self._tokenizer.bos_token_id
+            for max_len, max_new_tokens in _LENGTH_BINS:
+                for size in _COMPILED_BATCH_SIZES:
+                    # Keep the bin's max_new_tokens so the static cache matches real requests,
+                    # but stop after a prefill and a decode step
+                    self._generate_batch(
+                        [[bos]] * size, max_len, max_new_tokens, True,
+                        [ChatStream() for _ in range(size)],
+                        stopping_criteria=StoppingCriteriaList([StopAfterSteps(2)])
+                    )
+                    if self._eager_forward is None:
+                        return
+        except Exception as e:
+            print(f"torch.compile failed ({str(e)}), using eager mode")
+            self._disable_compile()
+
+    def _disable_compile(self):
+        """Go back to the eager forward pass and the default dynamic KV cache"""
+        if self._eager_forward is not None:
+            self._model.forward = self._eager_forward
+            self._model.generation_config.cache_implementation = None
+            self._eager_forward = None
 
-    def get_daily_nasa_image(self):
+    async def get_daily_nasa_image(self):
         """Fetch NASA's Astronomy Picture of the Day"""
         url = f"https://api.nasa.gov/planetary/apod?api_key={self.nasa_api_key}"
         try:
-            response = requests.get(url, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    'success': True,
-                    'title': data.get('title'),
-                    'url': data.get('url'),
-                    'explanation': data.get('explanation'),
-                    'date': data.get('date')
-                }
-            return {'success': False, 'error': f'Status code: {response.status_code}'}
+            data = await self._get_json(self.apod_cache, url)
+            return {
+                'success': True,
+                'title': data.get('title'),
+                'url': data.get('url'),
+                'explanation': data.get('explanation'),
+                'date': data.get('date')
+            }
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-    def search_nasa_images(self, query):
+    async def search_nasa_images(self, query):
         """Search NASA's image library"""
-        url = f"https://images-api.nasa.gov/search?q={query}&media_type=image"
+        # Normalize the query so equivalent searches share a cache entry
+        url = f"https://images-api.nasa.gov/search?q={quote_plus(query.strip().lower())}&media_type=image"
         try:
-            response = requests.get(url, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                images = []
-                if 'items' in data['collection']:
-                    for item in data['collection']['items'][:5]:
-                        if 'links' in item and item['links']:
-                            image_data = {
-                                'title': item['data'][0].get('title', 'No title'),
-                                'description': item['data'][0].get('description', 'No description'),
-                                'url': item['links'][0]['href'],
-                                'date_created': item['data'][0].get('date_created', 'Unknown date')
-                            }
-                            images.append(image_data)
-                return {'success': True, 'images': images}
-            return {'success': False, 'error': f'Status code: {response.status_code}'}
+            data = await self._get_json(self.search_cache, url)
+            images = [
+                {
+                    'title': meta.get('title', 'No title'),
+                    'description': meta.get('description', 'No description'),
+                    'url': item['links'][0]['href'],
+                    'date_created': meta.get('date_created', 'Unknown date')
+                }
+                for item in data['collection'].get('items', [])[:5] if item.get('links')
+                for meta in (item['data'][0],)
+            ]
+            return {'success': True, 'images': images}
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-    def chat_with_space_expert(self, message):
-        """Enhanced chat function using Gemma 2B for space topics."""
+    async def _get_json(self, cache, url):
+        """Fetch a NASA endpoint through a TTL cache, serving stale data while it refreshes"""
+        cached = cache.get(url)
+        if cached is None:
+            return await self._fetch_json(cache, url)
+        data, fresh = cached
+        if not fresh and cache.claim_refresh(url):
+            task = asyncio.create_task(self._refresh_json(cache, url))
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+        return data
+
+    async def _fetch_json(self, cache, url):
+        response = await self.http.get(url)
+        if response.status_code != 200:
+            raise NasaAPIError(f'Status code: {response.status_code}')
+        data = orjson.loads(response.content)
+        cache.set(url, data)
+        return data
+
+    async def _refresh_json(self, cache, url):
         try:
-            # Create a clean, focused prompt
-            prompt = f"As a space expert, explain: {message}"
-
-            # Format the input for Gemma
-            inputs = self.tokenizer(
-                prompt,
-                return_tensors="pt",
-                truncation=True,
-                max_length=512
-            )
-
-            # Generate response with improved parameters
-            outputs = self.model.generate(
-                inputs["input_ids"],
-                max_length=300,
-                min_length=50,
-                do_sample=True,
-                temperature=0.8,
-                top_p=0.95,
-                pad_token_id=self.tokenizer.pad_token_id,
-                repetition_penalty=1.2
-            )
-
-            # Clean and format the response
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            response = response.split("explain:")[-1].strip() if "explain:" in response.lower() else response
+            await self._fetch_json(cache, url)
+        except Exception:
+            pass
+        finally:
+            cache.release_refresh(url)
 
-            # Add a random fun fact
-            fun_fact = random.choice(self.space_knowledge['fun_facts'])
+    def chat_with_space_expert(self, message, greedy=False):
+        """Enhanced chat function using Gemma 2B for space topics.
 
-            # Format the final response
-            formatted_response = f"🚀 {response}\n\n✨ Fun Fact: {fun_fact}"
+        Yields the response as it grows, token by token. Set greedy to get a
+        deterministic answer instead of a sampled one.
+        """
+        response = "🚀 "
+        try:
+            for chunk in self._start_chat(message, greedy):
+                response += chunk
+                yield response
+        except Exception as e:
+            yield f"Houston, we have a problem! 🚀 Please try asking that question differently. Error: {str(e)}"
+
+    def _start_chat(self, message, greedy=False):
+        """Return the ChatStream for a response, reusing any greedy answer to the same question"""
+        message = message.strip()
+        if not greedy:
+            return self._generate_stream(message, greedy)
+
+        # In-flight and finished answers live in the same cache: readers of a stream
+        # still being generated follow along, later readers replay the whole answer
+        with self._answer_lock:
+            cached = self.answer_cache.get(message)
+            if cached is not None and not cached[0].failed:
+                return cached[0]
+            stream = self._generate_stream(message, greedy)
+            self.answer_cache.set(message, stream)
+            return stream
+
+    def _generate_stream(self, message, greedy=False):
+        """Start generating a response and return the ChatStream it is written to"""
+        # Create a clean, focused prompt
+        if self.llm_client is not None:
+            stream = ChatStream()
+            threading.Thread(
+                target=self._complete_remote,
+                args=(f"{_PROMPT_PREFIX} {message}", greedy, stream),
+                daemon=True
+            ).start()
+            return stream
+
+        self._ensure_model()
+
+        # Tokenize only the message (with its leading space) and reuse the prefix tokens.
+        # Truncate by slicing: truncation=True reconfigures the shared fast tokenizer, which
+        # races with the other chat threads and the batcher decoding on it concurrently
+        message_ids = self._tokenizer(f" {message}", add_special_tokens=False)["input_ids"]
+        budget = _MAX_PROMPT_TOKENS - len(self._prefix_ids)
+        return self.chat_batcher.submit(self._prefix_ids + message_ids[:budget], greedy)
+
+    def _generate_batch(self, batch_ids, max_len, max_new_tokens, greedy, streams, stopping_criteria=None):
+        """Generate a batch of tokenized prompts with a single generate call, streaming each row"""
+        compiled = self._eager_forward is not None
+        if compiled:
+            # Round the batch up to a warmed-up size; extra rows repeat a prompt into throwaway streams
+            size = next(size for size in _COMPILED_BATCH_SIZES if size >= len(batch_ids))
+            extra = size - len(batch_ids)
+            padded_ids = batch_ids + [batch_ids[-1]] * extra
+            padded_streams = streams + [ChatStream() for _ in range(extra)]
+        else:
+            padded_ids, padded_streams = batch_ids, streams
+
+        # Pad only up to the length bin, not the model's full context
+        lengths = np.array([len(ids) for ids in padded_ids], dtype=np.int64)
+        flat_ids = np.fromiter(chain.from_iterable(padded_ids), dtype=np.int64, count=int(lengths.sum()))
+        input_ids, attention_mask = build_left_padded_batch(
+            flat_ids, lengths, max_len, self._tokenizer.pad_token_id
+        )
 
-            return formatted_response
+        # Generate response, stopping as soon as every row has produced EOS
+        streamer = BatchStreamer(self._tokenizer, padded_streams)
+        try:
+            self._model.generate(
+                torch.from_numpy(input_ids).to(self._model.device),
+                attention_mask=torch.from_numpy(attention_mask).to(self._model.device),
+                max_new_tokens=max_new_tokens,
+                use_cache=True,
+                pad_token_id=self._tokenizer.pad_token_id,
+                eos_token_id=self._tokenizer.eos_token_id,
+                streamer=streamer,
+                stopping_criteria=stopping_criteria,
+                **(_GREEDY_KWARGS if greedy else _SAMPLING_KWARGS)
+            )
         except Exception as e:
-            return f"Houston, we have a problem! 🚀 Please try asking that question differently. Error: {str(e)}"
+            if not compiled:
+                raise
+            # The compiled graph failed on a live request: go eager from now on, and retry
+            # this batch if none of its text has been streamed yet
+            print(f"Compiled generate failed ({str(e)}), switching to eager mode")
+            self._disable_compile()
+            if streamer.started:
+                raise
+            self._generate_batch(batch_ids, max_len, max_new_tokens, greedy, streams, stopping_criteria)
+
+    def _complete_remote(self, prompt, greedy, stream):
+        """Stream a response from the vLLM server, which batches concurrent requests per token"""
+        settings = _GREEDY_KWARGS if greedy else _SAMPLING_KWARGS
+        try:
+            completion = self.llm_client.completions.create(
+                model=self.llm_model,
+                prompt=prompt,
+                max_tokens=_LENGTH_BINS[-1][1],
+                temperature=settings.get("temperature", 0.0),
+                top_p=settings.get("top_p", 1.0),
+                extra_body={"repetition_penalty": settings["repetition_penalty"]},
+                # Only newly generated text comes back, so nothing has to be stripped from it
+                echo=False,
+                stream=True
+            )
+            answer = ""
+            for chunk in completion:
+                answer += chunk.choices[0].text
+                stream.update(answer)
+            stream.put(fun_fact_footers(1)[0])
+            stream.finish()
+        except Exception as e:
+            stream.finish(e)
 
-    def get_space_weather(self):
+    async def get_space_weather(self):
         """Get current space weather information"""
         try:
             url = f"https://api.nasa.gov/DONKI/notifications?api_key={self.nasa_api_key}"
-            response = requests.get(url, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                if data:
-                    return self._format_real_weather(data[0])
+            data = await self._get_json(self.weather_cache, url)
+            if data:
+                return self._format_real_weather(data[0])
         except Exception:
             pass
         return self._generate_simulated_weather()
 
     def _format_real_weather(self, data):
         """Format real NASA weather data"""
-        weather_types = {
-            "Report": "🛸",
-            "Watch": "⚠️",
-            "Warning": "🚨",
-            "Alert": "⚡"
-        }
-
         message_type = data.get('messageType', 'Report')
-        emoji = weather_types.get(message_type, "🛸")
+        emoji = _WEATHER_EMOJI.get(message_type, "🛸")
+        body = data.get('messageBody', '')
 
         return {
             "status": f"{emoji} Space Weather {message_type}",
             "conditions": [
                 {"label": "Current Activity", "value": message_type, "emoji": emoji},
                 {"label": "Solar Activity",
-                 "value": "Active" if "flare" in data.get('messageBody', '').lower() else "Calm", "emoji": "🌞"},
+                 "value": "Active" if _FLARE_RE.search(body) else "Calm", "emoji": "🌞"},
                 {"label": "Aurora Forecast",
-                 "value": "Visible" if "aurora" in data.get('messageBody', '').lower() else "Not Visible", "emoji": "🌌"}
+                 "value": "Visible" if _AURORA_RE.search(body) else "Not Visible", "emoji": "🌌"}
             ],
             "description": data.get('messageBody', 'Space weather information currently unavailable'),
-            "time": datetime.now().strftime("%I:%M %p")
+            "time": _weather_time()
         }
 
     def _generate_simulated_weather(self):
         """Generate engaging simulated weather data"""
-        scenarios = [
-            {
-                "status": "🌟 Perfect Space Weather",
-                "conditions": [
-                    {"label": "Current Activity", "value": "Calm", "emoji": "✨"},
-                    {"label": "Solar Activity", "value": "Low", "emoji": "🌞"},
-                    {"label": "Aurora Forecast", "value": "Not Visible", "emoji": "🌙"}
-                ],
-                "description": "Perfect conditions for stargazing tonight! The Milky Way should be clearly visible.",
-            },
-            {
-                "status": "🌠 Aurora Alert",
-                "conditions": [
-                    {"label": "Current Activity", "value": "Active", "emoji": "⚡"},
-                    {"label": "Solar Activity", "value": "High", "emoji": "🌞"},
-                    {"label": "Aurora Forecast", "value": "Visible", "emoji": "🎆"}
-                ],
-                "description": "A solar storm is creating perfect conditions for aurora viewing! Look toward the northern horizon tonight.",
-            },
-            {
-                "status": "☄️ Meteor Shower",
-                "conditions": [
-                    {"label": "Current Activity", "value": "Special Event", "emoji": "☄️"},
-                    {"label": "Solar Activity", "value": "Normal", "emoji": "🌞"},
-                    {"label": "Aurora Forecast", "value": "Not Visible", "emoji": "🌙"}
-                ],
-                "description": "A meteor shower is expected tonight! Best viewing hours are between 11 PM and 3 AM.",
-            }
-        ]
-        weather = random.choice(scenarios)
-        weather["time"] = datetime.now().strftime("%I:%M %p")
+        weather = dict(random.choice(_WEATHER_SCENARIOS))
+        weather["time"] = _weather_time()
         return weather
 
 
+_EXPLORER = None
+_EXPLORER_LOCK = threading.Lock()
+
+
+def get_explorer():
+    """Return the process-wide SpaceImageExplorer, creating it on first use"""
+    global _EXPLORER
+    with _EXPLORER_LOCK:
+        if _EXPLORER is None:
+            _EXPLORER = SpaceImageExplorer()
+        return _EXPLORER
+
+
 def create_interface():
     try:
-        explorer = SpaceImageExplorer()
+        explorer = get_explorer()
+        explorer.preload_model()
     except Exception as e:
         return gr.Interface(
             fn=lambda x: f"Oops! Something went wrong. {str(e)} Please check if all settings are correct.",
@@ -219,8 +793,8 @@ def create_interface():
                     daily_explanation = gr.Markdown()
                     refresh_btn = gr.Button("Show Me Today's Image! 🔭")
 
-            def fetch_daily():
-                result = explorer.get_daily_nasa_image()
+            async def fetch_daily():
+                result = await explorer.get_daily_nasa_image()
                 if result['success']:
                     return (
                         result['url'],
@@ -231,7 +805,8 @@ def create_interface():
 
             refresh_btn.click(
                 fetch_daily,
-                outputs=[daily_image, daily_title, daily_explanation]
+                outputs=[daily_image, daily_title, daily_explanation],
+                concurrency_limit=_NASA_CONCURRENCY
             )
 
         with gr.Tab("🔍 Space Image Search"):
@@ -246,8 +821,8 @@ def create_interface():
             gallery = gr.Gallery(label="Discovered Images", show_label=False)
             image_info = gr.Markdown()
 
-            def search_images(query):
-                results = explorer.search_nasa_images(query)
+            async def search_images(query):
+                results = await explorer.search_nasa_images(query)
                 if results['success'] and results.get('images'):
                     images = [img['url'] for img in results['images']]
                     info = "### Discovered these amazing images!\nClick on any image to view it larger."
@@ -257,7 +832,8 @@ def create_interface():
             search_btn.click(
                 search_images,
                 inputs=[search_input],
-                outputs=[gallery, image_info]
+                outputs=[gallery, image_info],
+                concurrency_limit=_NASA_CONCURRENCY
             )
 
         with gr.Tab("💫 Space Chat"):
@@ -282,15 +858,20 @@ def create_interface():
                     scale=4
                 )
                 submit = gr.Button("Ask! 🚀", scale=1)
+            precise = gr.Checkbox(label="Precise answers (same question, same answer) 🎯", value=False)
             clear = gr.Button("Start Fresh 🌟")
 
-            def respond(message, history):
-                bot_message = explorer.chat_with_space_expert(message)
-                history.append((message, bot_message))
-                return "", history
-
-            msg.submit(respond, [msg, chatbot], [msg, chatbot])
-            submit.click(respond, [msg, chatbot], [msg, chatbot])
+            def respond(message, history, greedy):
+                history.append((message, ""))
+                for bot_message in explorer.chat_with_space_expert(message, greedy):
+                    history[-1] = (message, bot_message)
+                    yield "", history
+
+            # Both chat triggers share one limit sized to fill a generate batch
+            msg.submit(respond, [msg, chatbot, precise], [msg, chatbot],
+                       concurrency_limit=_MAX_BATCH, concurrency_id="chat")
+            submit.click(respond, [msg, chatbot, precise], [msg, chatbot],
+                         concurrency_limit=_MAX_BATCH, concurrency_id="chat")
             clear.click(lambda: None, None, chatbot, queue=False)
 
         with gr.Tab("🌤️ Space Weather"):
@@ -312,8 +893,8 @@ def create_interface():
 
             check_weather = gr.Button("Check Space Weather 🛸")
 
-            def update_weather():
-                weather = explorer.get_space_weather()
+            async def update_weather():
+                weather = await explorer.get_space_weather()
                 condition_data = [
                     [f"{cond['emoji']} {cond['label']}", cond['value']]
                     for cond in weather['conditions']
@@ -327,9 +908,12 @@ def create_interface():
 
             check_weather.click(
                 update_weather,
-                outputs=[status, description, time_updated, conditions]
+                outputs=[status, description, time_updated, conditions],
+                concurrency_limit=_NASA_CONCURRENCY
             )
 
+    # Let concurrent chat requests reach the batcher instead of running one at a time
+    demo.queue(default_concurrency_limit=_MAX_BATCH, max_size=_QUEUE_MAX_SIZE)
     return demo
 
 
@@ -337,4 +921,5 @@ if __name__ == "__main__":
     print(f"===== Application Startup at {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} =====")
     print(f"Current User: {os.getenv('USER', 'Guest')}")
     demo = create_interface()
-    demo.launch(share=True)
\ No newline at end of file
+    # A public share link adds a relay hop to every request, so it is opt-in
+    demo.launch(share=os.getenv('GRADIO_SHARE') == '1', server_name="0.0.0.0")
\ No newline at end of file